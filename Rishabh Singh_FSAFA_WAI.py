@@ -4,11 +4,19 @@
 # Proxy Models | Yahoo Finance | Audit-Grade
 # =========================================================
 
+import math
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+
 import streamlit as st
 import pandas as pd
 import numpy as np
-import yfinance as yf
-import plotly.express as px
+
+from forensic_kernels import beneish_kernel, piotroski_kernel, rem_kernel
 
 # =========================================================
 # PAGE CONFIG & STYLING
@@ -19,7 +27,7 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-st.markdown("""
+CSS_BLOCK = """
 <style>
 .main { background-color: #0b1220; }
 .block-container { max-width: 1250px; padding-top: 2rem; padding-bottom: 2rem; }
@@ -34,6 +42,12 @@ h1, h2, h3 { color: #E5E7EB; font-weight: 600; }
 }
 
 /* KPI Cards */
+.kpi-grid {
+    display: grid;
+    grid-template-columns: repeat(5, 1fr);
+    gap: 16px;
+}
+
 .kpi-box {
     background: linear-gradient(145deg, #111827, #0f172a);
     padding: 20px;
@@ -75,7 +89,9 @@ h1, h2, h3 { color: #E5E7EB; font-weight: 600; }
     overflow: hidden;
 }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(CSS_BLOCK, unsafe_allow_html=True)
 
 # =========================================================
 # HEADER
@@ -95,177 +111,388 @@ st.markdown("""
 # HELPER FUNCTIONS
 # =========================================================
 def safe(x):
-    try:
-        if pd.isna(x) or np.isinf(x):
-            return None
-        return float(x)
-    except:
-        return None
+    x = float("nan") if x is None else float(x)
+    return x if math.isfinite(x) else None
+
+def fmt(x, digits):
+    return "N/A" if x is None else round(x, digits)
 
-def get_col(df, names):
+def as_array(s):
+    # copy so the kernels always receive a writable float64 array matching their signatures
+    return s.to_numpy(dtype=np.float64, copy=True)
+
+def get_col(colmap, values, names):
     for n in names:
-        if n in df.columns:
-            return df[n]
-    return np.nan
+        i = colmap.get(n)
+        if i is not None:
+            return values[:, i]
+    return np.full(len(values), np.nan)
+
+def pct_change(a):
+    out = np.full_like(a, np.nan)
+    out[1:] = a[1:] / a[:-1] - 1
+    return out
+
+def linear_trend(x, y):
+    valid = np.isfinite(x) & np.isfinite(y)
+    if valid.sum() < 2:
+        return np.full_like(x, np.nan)
+    m, b = np.polyfit(x[valid], y[valid], 1)
+    return m * x + b
 
 def kpi_box(title, value, label):
-    st.markdown(f"""
-    <div class="kpi-box">
-        <div class="kpi-title">{title}</div>
-        <div class="kpi-value">{value}</div>
-        <div class="kpi-label">{label}</div>
-    </div>
-    """, unsafe_allow_html=True)
+    # unindented so the cards can be concatenated without markdown
+    # treating the HTML as a code block
+    return (
+        f'<div class="kpi-box">'
+        f'<div class="kpi-title">{title}</div>'
+        f'<div class="kpi-value">{value}</div>'
+        f'<div class="kpi-label">{label}</div>'
+        f'</div>'
+    )
 
 # =========================================================
 # FETCH FINANCIAL DATA
 # =========================================================
-def fetch_financials(ticker):
-    c = yf.Ticker(ticker)
-    df = (
-        c.financials.T
-        .join(c.balance_sheet.T, how="inner")
-        .join(c.cashflow.T, how="inner")
-    )
+# Statement rows consumed by create_features (including alternate labels)
+RAW_ROWS = [
+    "Total Revenue",
+    "Net Income",
+    "Total Cash From Operating Activities",
+    "Operating Cash Flow",
+    "Total Assets",
+    "Net Receivables",
+    "Cost Of Revenue",
+]
+
+# Parquet copies of fetched statements, one file per ticker per day
+CACHE_DIR = Path(".cache")
+CACHE_MAX_AGE_DAYS = 7
+
+# Tickers fetched at once by fetch_financials_batch; each one runs three
+# statement requests, so at most six Yahoo requests are in flight
+BATCH_WORKERS = 2
+
+def project(stmt):
+    return stmt.loc[stmt.index.intersection(RAW_ROWS)]
+
+@st.cache_resource
+def purge_file_cache():
+    if CACHE_DIR.exists():
+        cutoff = time.time() - CACHE_MAX_AGE_DAYS * 86400
+        for f in CACHE_DIR.iterdir():
+            # another worker may replace or purge the file concurrently
+            try:
+                if f.stat().st_mtime < cutoff:
+                    f.unlink()
+            except FileNotFoundError:
+                pass
+    return True
+
+purge_file_cache()
+
+def normalize_ticker(ticker):
+    # one canonical symbol per company for the in-memory and on-disk caches;
+    # the symbol becomes part of a file name, so path separators are refused
+    ticker = ticker.strip().upper()
+    if not ticker or any(sep in ticker for sep in ("/", "\\", os.sep)):
+        raise ValueError(f"Invalid ticker symbol: {ticker!r}")
+    return ticker
+
+def cache_path(ticker):
+    # the date in the file name acts as a daily TTL shared across restarts
+    return CACHE_DIR / f"{ticker}_{date.today().isoformat()}.parquet"
+
+def write_cache(ticker, df):
+    if df.empty:
+        return
+    CACHE_DIR.mkdir(exist_ok=True)
+    # write to a temp file and rename so other workers never read a partial file
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        df.to_parquet(tmp, compression="zstd")
+        os.replace(tmp, cache_path(ticker))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def fetch_statements(c):
+    # the three statements are separate HTTP requests; download them concurrently
+    with ThreadPoolExecutor(3) as ex:
+        fin, bs, cf = ex.map(
+            lambda get: project(get(pretty=True)),
+            [c.get_income_stmt, c.get_balance_sheet, c.get_cashflow],
+        )
+    # one inner alignment across all three statements; a row label reported
+    # by more than one statement is kept from the first
+    df = pd.concat([fin.T, bs.T, cf.T], axis=1, join="inner")
+    df = df.loc[:, ~df.columns.duplicated()]
+    # unknown tickers and failed requests come back as empty statements
+    if df.empty:
+        return df
     df.index = df.index.year
     return df.sort_index()
 
-# =========================================================
-# FEATURE ENGINEERING
-# =========================================================
-def create_features(df):
-    df = df.copy()
+def load_or_fetch(ticker, ticker_obj):
+    # ticker must already be normalized; serves today's parquet copy if present
+    path = cache_path(ticker)
+    if path.exists():
+        return pd.read_parquet(path)
 
-    df["Revenue"] = get_col(df, ["Total Revenue"])
-    df["Net_Income"] = get_col(df, ["Net Income"])
-    df["OCF"] = get_col(df, ["Total Cash From Operating Activities", "Operating Cash Flow"])
-    df["Total_Assets"] = get_col(df, ["Total Assets"])
-    df["Receivables"] = get_col(df, ["Net Receivables"])
-    df["COGS"] = get_col(df, ["Cost Of Revenue"])
-
-    df = df.dropna(subset=["Revenue", "Net_Income", "OCF", "Total_Assets"])
+    df = fetch_statements(ticker_obj)
+    write_cache(ticker, df)
+    return df
 
-    df["Gross_Margin"] = (df["Revenue"] - df["COGS"]) / df["Revenue"]
-    df["Accruals_Ratio"] = (df["Net_Income"] - df["OCF"]) / df["Total_Assets"]
-    df["ROA"] = df["Net_Income"] / df["Total_Assets"]
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_financials(ticker):
+    ticker = normalize_ticker(ticker)
+    # a fresh yf.Ticker per fetch: it memoizes downloaded statements (including
+    # empty frames from failed requests), while cookie/crumb state already lives
+    # in yfinance's shared session
+    import yfinance as yf
+    return load_or_fetch(ticker, yf.Ticker(ticker))
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_financials_batch(tickers):
+    # peer comparison: tickers missing from the parquet cache are downloaded
+    # concurrently through one shared yf.Tickers session
+    tickers = list(dict.fromkeys(normalize_ticker(t) for t in tickers))
+    if not tickers:
+        return {}
+
+    import yfinance as yf
+    bulk = yf.Tickers(" ".join(tickers))
+
+    def fetch_one(t):
+        # one failing ticker yields an empty frame, like an unknown symbol,
+        # instead of aborting the whole batch
+        try:
+            return load_or_fetch(t, bulk.tickers[t])
+        except Exception:
+            return pd.DataFrame()
+
+    with ThreadPoolExecutor(min(len(tickers), BATCH_WORKERS)) as ex:
+        return dict(zip(tickers, ex.map(fetch_one, tickers)))
 
-    # REM indicators
-    df["OCF_to_Revenue"] = df["OCF"] / df["Revenue"]
-    df["Revenue_Growth"] = df["Revenue"].pct_change()
-    df["OCF_Growth"] = df["OCF"].pct_change()
-    df["Sales_Cash_Gap"] = df["Revenue_Growth"] - df["OCF_Growth"]
-    df["COGS_to_Revenue"] = df["COGS"] / df["Revenue"]
+# =========================================================
+# FEATURE ENGINEERING
+# =========================================================
+# Columns create_features adds for internal use; not shown in the data table
+INTERNAL_COLUMNS = [
+    "Receivables_to_Revenue_Growth",
+    "COGS_to_Revenue_Growth",
+    "Total_Assets_Growth",
+    "Gross_Margin_Trend",
+]
 
-    return df
+def create_features(df):
+    # resolve column aliases with one dict built per frame, reading from a
+    # single float64 copy of the statement data
+    colmap = {c: i for i, c in enumerate(df.columns)}
+    values = df.to_numpy(dtype=np.float64)
+
+    raw = np.column_stack([
+        get_col(colmap, values, ["Total Revenue"]),
+        get_col(colmap, values, ["Net Income"]),
+        get_col(colmap, values, ["Total Cash From Operating Activities", "Operating Cash Flow"]),
+        get_col(colmap, values, ["Total Assets"]),
+        get_col(colmap, values, ["Net Receivables"]),
+        get_col(colmap, values, ["Cost Of Revenue"]),
+    ])
+
+    # keep years where revenue, net income, OCF and total assets are all known
+    mask = np.isfinite(raw[:, :4]).all(axis=1)
+    raw = raw[mask]
+
+    # all derived features are computed on plain float64 arrays and the
+    # result frame is built once, avoiding per-column pandas alignment
+    rev, ni, ocf, ta, rec, cogs = raw.T
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        revenue_growth = pct_change(rev)
+        ocf_growth = pct_change(ocf)
+        cogs_to_revenue = cogs / rev
+        gross_margin = (rev - cogs) / rev
+
+        features = {
+            "Revenue": rev,
+            "Net_Income": ni,
+            "OCF": ocf,
+            "Total_Assets": ta,
+            "Receivables": rec,
+            "COGS": cogs,
+            "Gross_Margin": gross_margin,
+            "Accruals_Ratio": (ni - ocf) / ta,
+            "ROA": ni / ta,
+
+            # REM indicators
+            "OCF_to_Revenue": ocf / rev,
+            "Revenue_Growth": revenue_growth,
+            "OCF_Growth": ocf_growth,
+            "Sales_Cash_Gap": revenue_growth - ocf_growth,
+            "COGS_to_Revenue": cogs_to_revenue,
+
+            # growth rates reused by the forensic scores
+            "Receivables_to_Revenue_Growth": pct_change(rec / rev),
+            "COGS_to_Revenue_Growth": pct_change(cogs_to_revenue),
+            "Total_Assets_Growth": pct_change(ta),
+
+            # least-squares line for the gross margin vs revenue growth chart
+            "Gross_Margin_Trend": linear_trend(revenue_growth, gross_margin),
+        }
+
+    return pd.DataFrame(features, index=df.index[mask])
 
 # =========================================================
 # FORENSIC SCORES
 # =========================================================
 def beneish_m_proxy(df):
-    dsri = (df["Receivables"] / df["Revenue"]).pct_change().dropna()
-    dsri = dsri.iloc[-1] + 1 if not dsri.empty else 1
-
-    gmi = (df["Gross_Margin"].shift(1) / df["Gross_Margin"]).dropna()
-    gmi = gmi.iloc[-1] if not gmi.empty else 1
-
-    sgi = df["Revenue"].pct_change().dropna()
-    sgi = sgi.iloc[-1] + 1 if not sgi.empty else 1
-
-    tata = df["Accruals_Ratio"].iloc[-1]
-
-    return safe(-4.84 + 0.92*dsri + 0.528*gmi + 0.892*sgi + 0.404*tata)
+    return safe(beneish_kernel(
+        as_array(df["Receivables_to_Revenue_Growth"]), as_array(df["Revenue_Growth"]),
+        as_array(df["Gross_Margin"]), as_array(df["Accruals_Ratio"]),
+    ))
 
 def piotroski_f_score(df):
     if len(df) < 2:
         return None
 
-    f = 0
-    f += df["Net_Income"].iloc[-1] > 0
-    f += df["OCF"].iloc[-1] > 0
-    f += df["ROA"].iloc[-1] > df["ROA"].iloc[-2]
-    f += df["OCF"].iloc[-1] > df["Net_Income"].iloc[-1]
-    f += df["Revenue"].pct_change().iloc[-1] > 0
-    f += df["Gross_Margin"].iloc[-1] > df["Gross_Margin"].iloc[-2]
-    f += df["Total_Assets"].pct_change().iloc[-1] <= 0
-
-    return int(f)
+    return int(piotroski_kernel(
+        as_array(df["Net_Income"]), as_array(df["OCF"]), as_array(df["ROA"]),
+        as_array(df["Revenue_Growth"]), as_array(df["Gross_Margin"]), as_array(df["Total_Assets_Growth"]),
+    ))
 
 def rem_risk(df):
-    r1 = 1 if df["OCF_to_Revenue"].iloc[-1] < 0.10 else 0
-    r2 = 1 if df["Sales_Cash_Gap"].iloc[-1] > 0.10 else 0
-    r3 = 1 if df["COGS_to_Revenue"].pct_change().iloc[-1] < -0.05 else 0
-    return (r1 + r2 + r3) / 3
+    return rem_kernel(
+        as_array(df["OCF_to_Revenue"]), as_array(df["Sales_Cash_Gap"]),
+        as_array(df["COGS_to_Revenue_Growth"]),
+    )
 
 # =========================================================
-# MAIN APP
+# FORENSIC PIPELINE
 # =========================================================
-ticker = st.text_input("Enter Company Ticker (e.g. TCS.NS, RELIANCE.NS, AAPL)")
-
-if ticker:
+@st.cache_data(ttl=3600, show_spinner=False)
+def analyze(ticker):
+    ticker = normalize_ticker(ticker)
     df = create_features(fetch_financials(ticker))
+    # the numba kernels index [-1]/[-2] without bounds checks
+    if df.empty:
+        return None
 
     beneish = beneish_m_proxy(df)
     fscore = piotroski_f_score(df)
     accrual = safe(df["Accruals_Ratio"].iloc[-1])
     rem = rem_risk(df)
 
-    risks = [
-        1 if beneish and beneish > -2.22 else 0,
-        0 if fscore and fscore >= 7 else (0.5 if fscore and fscore >= 4 else 1),
-        0 if accrual and abs(accrual) < 0.05 else (0.5 if abs(accrual) < 0.10 else 1),
-        rem
-    ]
-    fraud_prob = round(np.mean(risks) * 100, 2)
+    beneish_risk = 1 if beneish is not None and beneish > -2.22 else 0
+    fscore_risk = 1 if fscore is None or fscore < 4 else (0.5 if fscore < 7 else 0)
+    accrual_risk = 1 if accrual is None or abs(accrual) >= 0.10 else (0.5 if abs(accrual) >= 0.05 else 0)
+    fraud_prob = round((beneish_risk + fscore_risk + accrual_risk + rem) / 4 * 100, 2)
+
+    # Arrow-backed copy for st.dataframe, which serializes tables to Arrow anyway
+    table = df.drop(columns=INTERNAL_COLUMNS)
+    df_display = table.round(3).astype(
+        {c: "float64[pyarrow]" for c in table.columns if table[c].dtype == "float64"}
+    )
+
+    return {
+        "df": df,
+        "df_display": df_display,
+        "beneish": beneish,
+        "fscore": fscore,
+        "accrual": accrual,
+        "rem": rem,
+        "fraud_prob": fraud_prob,
+    }
+
+# =========================================================
+# MAIN APP
+# =========================================================
+ticker = st.text_input("Enter Company Ticker (e.g. TCS.NS, RELIANCE.NS, AAPL)")
+
+if ticker:
+    # plotting modules are only needed once a ticker is analysed
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    try:
+        ticker = normalize_ticker(ticker)
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
+
+    result = analyze(ticker)
+    if result is None:
+        st.warning(f"No complete financial years available for {ticker}")
+        st.stop()
+
+    df = result["df"]
+    df_display = result["df_display"]
+    beneish = result["beneish"]
+    fscore = result["fscore"]
+    accrual = result["accrual"]
+    rem = result["rem"]
+    fraud_prob = result["fraud_prob"]
 
     # =====================================================
     # KPI SCORECARD
     # =====================================================
     st.markdown('<h3 class="section-header">🧮 Forensic Scorecard</h3>', unsafe_allow_html=True)
 
-    c1, c2, c3, c4, c5 = st.columns(5)
-    with c1: kpi_box("Beneish M-Score", round(beneish,2), "Accrual Risk")
-    with c2: kpi_box("Piotroski F-Score", fscore, "Financial Quality")
-    with c3: kpi_box("Accruals Ratio", round(abs(accrual),3), "Earnings Quality")
-    with c4: kpi_box("REM Score", round(rem,2), "Early Management Signal")
-    with c5: kpi_box("Manipulation Probability", f"{fraud_prob}%", "Composite Risk")
+    # all five cards go out as one markdown element
+    kpis = [
+        ("Beneish M-Score", fmt(beneish, 2), "Accrual Risk"),
+        ("Piotroski F-Score", fmt(fscore, 0), "Financial Quality"),
+        ("Accruals Ratio", fmt(None if accrual is None else abs(accrual), 3), "Earnings Quality"),
+        ("REM Score", round(rem,2), "Early Management Signal"),
+        ("Manipulation Probability", f"{fraud_prob}%", "Composite Risk"),
+    ]
+    st.markdown(
+        '<div class="kpi-grid">' + "".join(kpi_box(*k) for k in kpis) + '</div>',
+        unsafe_allow_html=True
+    )
 
     # =====================================================
     # FORENSIC VISUALS (ADDED)
     # =====================================================
     st.markdown('<h3 class="section-header">📊 Forensic Visual Diagnostics</h3>', unsafe_allow_html=True)
 
-    col1, col2 = st.columns(2)
-    with col1:
-        st.plotly_chart(
-            px.line(df, y=["Revenue", "OCF"], title="Revenue vs Operating Cash Flow"),
-            use_container_width=True
-        )
-    with col2:
-        st.plotly_chart(
-            px.bar(df, y="Accruals_Ratio", title="Accruals Ratio Trend"),
-            use_container_width=True
-        )
+    # a single 2x2 figure is serialized and drawn once instead of four charts
+    fig = make_subplots(
+        rows=2, cols=2,
+        subplot_titles=[
+            "Revenue vs Operating Cash Flow",
+            "Accruals Ratio Trend",
+            "REM Component Breakdown (Latest Year)",
+            "Gross Margin vs Revenue Growth",
+        ],
+    )
 
-    col3, col4 = st.columns(2)
-    with col3:
-        rem_df = df[["OCF_to_Revenue", "Sales_Cash_Gap", "COGS_to_Revenue"]].iloc[-1]
-        st.plotly_chart(
-            px.bar(rem_df, title="REM Component Breakdown (Latest Year)"),
-            use_container_width=True
-        )
-    with col4:
-        st.plotly_chart(
-            px.scatter(df, x="Revenue_Growth", y="Gross_Margin",
-                       title="Gross Margin vs Revenue Growth",
-                       trendline="ols"),
-            use_container_width=True
-        )
+    # only the Revenue/OCF lines need a legend to be told apart
+    for col in ["Revenue", "OCF"]:
+        fig.add_trace(go.Scatter(x=df.index, y=df[col], mode="lines", name=col), row=1, col=1)
+
+    fig.add_trace(go.Bar(x=df.index, y=df["Accruals_Ratio"], name="Accruals_Ratio",
+                         showlegend=False), row=1, col=2)
+
+    rem_df = df[["OCF_to_Revenue", "Sales_Cash_Gap", "COGS_to_Revenue"]].iloc[-1]
+    fig.add_trace(go.Bar(x=rem_df.index, y=rem_df.values, name="REM Components",
+                         showlegend=False), row=2, col=1)
+
+    trend = df[["Revenue_Growth", "Gross_Margin_Trend"]].dropna().sort_values("Revenue_Growth")
+    fig.add_trace(go.Scatter(x=df["Revenue_Growth"], y=df["Gross_Margin"], mode="markers",
+                             name="Gross_Margin", showlegend=False), row=2, col=2)
+    fig.add_trace(go.Scatter(x=trend["Revenue_Growth"], y=trend["Gross_Margin_Trend"], mode="lines",
+                             name="Trend", showlegend=False), row=2, col=2)
+
+    fig.update_layout(height=800)
+    st.plotly_chart(fig, use_container_width=True)
 
     # =====================================================
     # DATA TABLE
     # =====================================================
     st.markdown('<h3 class="section-header">📄 Historical Financial Data</h3>', unsafe_allow_html=True)
-    st.dataframe(df.round(3))
+    st.dataframe(df_display)
 
     # =====================================================
     # FORENSIC CONCLUSION
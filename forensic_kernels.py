@@ -0,0 +1,59 @@
+# =========================================================
+# FORENSIC SCORE KERNELS
+# Numba-compiled Beneish / Piotroski / REM arithmetic
+# =========================================================
+# Kept in an importable module so the kernels are compiled once per
+# process (Streamlit re-executes the app script, not its imports).
+# Explicit signatures compile eagerly at import, and cache=True stores
+# the machine code next to this file; running
+#     python forensic_kernels.py
+# at build time means the first request never waits on the JIT.
+
+import numpy as np
+import numba
+
+# numpy error model: divisions by zero yield inf/nan like pandas instead of raising
+def jit(sig):
+    return numba.njit(sig, cache=True, error_model="numpy")
+
+@jit("f8(f8[:], f8)")
+def last_valid(a, default):
+    for i in range(len(a) - 1, -1, -1):
+        if not np.isnan(a[i]):
+            return a[i]
+    return default
+
+@jit("f8(f8[:], f8[:], f8[:], f8[:])")
+def beneish_kernel(receivables_growth, revenue_growth, gross_margin, accruals):
+    dsri = last_valid(receivables_growth, 0.0) + 1
+    gmi = last_valid(gross_margin[:-1] / gross_margin[1:], 1.0)
+    sgi = last_valid(revenue_growth, 0.0) + 1
+    tata = accruals[-1]
+
+    return -4.84 + 0.92*dsri + 0.528*gmi + 0.892*sgi + 0.404*tata
+
+@jit("i8(f8[:], f8[:], f8[:], f8[:], f8[:], f8[:])")
+def piotroski_kernel(net_income, ocf, roa, revenue_growth, gross_margin, assets_growth):
+    f = 0
+    f += net_income[-1] > 0
+    f += ocf[-1] > 0
+    f += roa[-1] > roa[-2]
+    f += ocf[-1] > net_income[-1]
+    f += revenue_growth[-1] > 0
+    f += gross_margin[-1] > gross_margin[-2]
+    f += assets_growth[-1] <= 0
+    return f
+
+@jit("f8(f8[:], f8[:], f8[:])")
+def rem_kernel(ocf_to_revenue, sales_cash_gap, cogs_to_revenue_growth):
+    r1 = 1 if ocf_to_revenue[-1] < 0.10 else 0
+    r2 = 1 if sales_cash_gap[-1] > 0.10 else 0
+    r3 = 1 if cogs_to_revenue_growth[-1] < -0.05 else 0
+    return (r1 + r2 + r3) / 3
+
+if __name__ == "__main__":
+    _probe = np.array([1.0, 2.0])
+    beneish_kernel(_probe, _probe, _probe, _probe)
+    piotroski_kernel(_probe, _probe, _probe, _probe, _probe, _probe)
+    rem_kernel(_probe, _probe, _probe)
+    print("forensic kernels compiled and cached")